@@ -1,18 +1,66 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import csv
+import io
+import gzip
+import hashlib
+import time
 from datetime import datetime
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 import joblib
 import os
+from werkzeug.http import is_resource_modified
 from disease_detection import disease_detector
+from sensor_cache import sensor_cache, METRIC_COLUMNS
+
+try:
+    import brotli  # Optional - enables "br" response compression
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
 
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 500
+
+# Weather API settings - WEATHER_API_URL can point at a local stub server
+WEATHER_API_KEY = "YOUR_API_KEY"  # Get from openweathermap.org
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', "http://api.openweathermap.org/data/2.5/weather")
+
+# Weather location (city) per farm / device group
+FARM_LOCATIONS = {
+    'default': "Raipur"  # Chhattisgarh capital
+}
+
+# How long fetched weather is reused before calling the API again
+WEATHER_CACHE_SECONDS = 600
+
+# How long to wait before retrying a location whose fetch failed
+WEATHER_RETRY_SECONDS = 30
+
+# Max weather requests in flight at once (also the HTTP connection pool size)
+WEATHER_MAX_WORKERS = 64
+
+# Shared keep-alive session so repeated fetches reuse TCP connections
+weather_session = requests.Session()
+weather_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=WEATHER_MAX_WORKERS))
+weather_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=WEATHER_MAX_WORKERS))
+
+# location -> {'data': ..., 'fetched_at': ..., 'ok': ...}
+_weather_cache = {}
+_weather_cache_lock = threading.Lock()
+
+# Rows fetched per keyset page when streaming exports
+EXPORT_PAGE_SIZE = 1000
+
 # Initialize database
 def init_db():
     conn = sqlite3.connect('farm_data.db')
@@ -26,6 +74,11 @@ def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # Supports range queries and keyset pagination on (timestamp, id)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp_id
+        ON sensor_data (timestamp, id)
+    ''')
     conn.commit()
     conn.close()
 
@@ -47,32 +100,90 @@ def get_crop_recommendation(temperature, humidity, soil_moisture):
         return "🥕 Mixed vegetables, Legumes - General crops suitable for current conditions"
 
 # Weather API integration
-def get_weather_data():
-    """Fetch real-time weather data for Chhattisgarh"""
+def fetch_weather(city):
+    """Fetch real-time weather data for a city, raising on failure"""
     # Using OpenWeatherMap API (free tier)
-    api_key = "YOUR_API_KEY"  # Get from openweathermap.org
-    city = "Raipur"  # Chhattisgarh capital
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
+    params = {'q': city, 'appid': WEATHER_API_KEY, 'units': 'metric'}
     
+    response = weather_session.get(WEATHER_API_URL, params=params, timeout=5)
+    data = response.json()
+    return {
+        'temperature': data['main']['temp'],
+        'humidity': data['main']['humidity'],
+        'description': data['weather'][0]['description'],
+        'wind_speed': data['wind']['speed'],
+        'pressure': data['main']['pressure']
+    }
+
+def get_weather_placeholder():
+    """Placeholder weather shown while the API is unavailable"""
+    return {
+        'temperature': 25.0,
+        'humidity': 60.0,
+        'description': 'Weather data unavailable',
+        'wind_speed': 5.0,
+        'pressure': 1013.0
+    }
+
+def get_weather_data(city=FARM_LOCATIONS['default']):
+    """Fetch real-time weather data for a city
+
+    Returns (weather, ok); ok is False when the fetch failed and
+    placeholder data is returned instead.
+    """
     try:
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        return {
-            'temperature': data['main']['temp'],
-            'humidity': data['main']['humidity'],
-            'description': data['weather'][0]['description'],
-            'wind_speed': data['wind']['speed'],
-            'pressure': data['main']['pressure']
-        }
+        return fetch_weather(city), True
     except Exception as e:
-        print(f"Weather API error: {e}")
-        return {
-            'temperature': 25.0,
-            'humidity': 60.0,
-            'description': 'Weather data unavailable',
-            'wind_speed': 5.0,
-            'pressure': 1013.0
-        }
+        print(f"Weather API error ({city}): {e}")
+        return get_weather_placeholder(), False
+
+def is_weather_stale(entry, now):
+    """Whether a cache entry needs refetching - failed fetches are retried sooner"""
+    if entry is None:
+        return True
+    max_age = WEATHER_CACHE_SECONDS if entry['ok'] else WEATHER_RETRY_SECONDS
+    return now - entry['fetched_at'] >= max_age
+
+def refresh_weather(locations=None, max_workers=WEATHER_MAX_WORKERS):
+    """Fetch weather for several farm locations concurrently
+
+    ``locations`` are FARM_LOCATIONS keys. Requests run on a bounded thread
+    pool over the shared session, so refreshing many sites takes roughly
+    one round trip. Returns {location: weather} and updates the cache.
+    A failed fetch keeps the previous good data if there is any; otherwise
+    the placeholder is cached for only WEATHER_RETRY_SECONDS.
+    """
+    if locations is None:
+        locations = list(FARM_LOCATIONS)
+    if not locations:
+        return {}
+    
+    cities = [FARM_LOCATIONS[location] for location in locations]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(locations))) as executor:
+        results = list(executor.map(get_weather_data, cities))
+    
+    now = time.time()
+    weather = {}
+    with _weather_cache_lock:
+        for location, (data, ok) in zip(locations, results):
+            previous = _weather_cache.get(location)
+            if ok or previous is None or not previous['ok']:
+                _weather_cache[location] = {'data': data, 'fetched_at': now, 'ok': ok}
+            else:
+                # Keep serving the last good data but retry soon
+                previous['fetched_at'] = now - WEATHER_CACHE_SECONDS + WEATHER_RETRY_SECONDS
+            weather[location] = _weather_cache[location]['data']
+    return weather
+
+def get_cached_weather_data(location='default'):
+    """Return weather data for a location, refreshing it when stale"""
+    with _weather_cache_lock:
+        entry = _weather_cache.get(location)
+    if is_weather_stale(entry, time.time()):
+        refresh_weather([location])
+        with _weather_cache_lock:
+            entry = _weather_cache[location]
+    return entry['data'], entry['fetched_at']
 
 # Get farming advice based on conditions
 def get_farming_advice(temperature, humidity, soil_moisture, weather_data):
@@ -119,13 +230,30 @@ def receive_sensor_data():
         conn.commit()
         conn.close()
         
+        # Mirror the new reading into the columnar history cache
+        try:
+            sensor_cache.sync()
+        except Exception as e:
+            print(f"Sensor cache sync error: {e}")
+        
         return jsonify({'status': 'success', 'message': 'Data received successfully'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/dashboard-data')
 def get_dashboard_data():
-    """Get all data for dashboard display"""
+    """Get all data for dashboard display
+
+    Supports conditional GET (If-None-Match / ETag) and an optional
+    ``since`` cursor: pass the ``cursor`` value from a previous response to
+    receive only the historical rows added after it. ``location`` selects
+    the farm whose weather is shown and must be a FARM_LOCATIONS key.
+    """
+    since = request.args.get('since', type=int)
+    location = request.args.get('location', 'default')
+    if location not in FARM_LOCATIONS:
+        return jsonify({'error': f'Unknown location: {location}'}), 400
+
     conn = sqlite3.connect('farm_data.db')
     cursor = conn.cursor()
     
@@ -137,8 +265,25 @@ def get_dashboard_data():
     ''')
     latest_data = cursor.fetchone()
     
+    # Newest reading id - changes whenever a reading is stored
+    cursor.execute('SELECT MAX(id) FROM sensor_data')
+    latest_id = cursor.fetchone()[0] or 0
+    
     # Get weather data
-    weather = get_weather_data()
+    weather, _ = get_cached_weather_data(location)
+    
+    # Answer unchanged polls with 304 before doing any further work. Only
+    # the ETag is used: reading timestamps have one-second resolution and
+    # say nothing about weather refreshes, so Last-Modified is not sent.
+    # The weather part hashes the content rather than the fetch time, so
+    # re-fetching identical (or placeholder) weather keeps the ETag stable.
+    weather_digest = hashlib.sha1(json.dumps(weather, sort_keys=True).encode()).hexdigest()[:12]
+    etag = f"{latest_id}-{weather_digest}"
+    if not is_resource_modified(request.environ, etag=etag):
+        conn.close()
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
     
     # Get crop recommendation and farming advice
     if latest_data:
@@ -152,18 +297,27 @@ def get_dashboard_data():
         recommendation = "No sensor data available - Connect your ESP32 device"
         advice = ["Connect your ESP32 device to start monitoring"]
     
-    # Get historical data for trends (last 24 hours)
-    cursor.execute('''
-        SELECT temperature, humidity, soil_moisture, timestamp
-        FROM sensor_data
-        WHERE timestamp > datetime('now', '-1 day')
-        ORDER BY timestamp ASC
-    ''')
+    # Get historical data for trends (last 24 hours), only rows newer
+    # than the client's cursor when one is given
+    if since is not None:
+        cursor.execute('''
+            SELECT temperature, humidity, soil_moisture, timestamp
+            FROM sensor_data
+            WHERE timestamp > datetime('now', '-1 day') AND id > ?
+            ORDER BY timestamp ASC
+        ''', (since,))
+    else:
+        cursor.execute('''
+            SELECT temperature, humidity, soil_moisture, timestamp
+            FROM sensor_data
+            WHERE timestamp > datetime('now', '-1 day')
+            ORDER BY timestamp ASC
+        ''')
     historical_data = cursor.fetchall()
     
     conn.close()
     
-    return jsonify({
+    response = jsonify({
         'sensor_data': {
             'temperature': latest_data[0] if latest_data else None,
             'humidity': latest_data[1] if latest_data else None,
@@ -173,8 +327,74 @@ def get_dashboard_data():
         'weather': weather,
         'recommendation': recommendation,
         'advice': advice,
-        'historical_data': historical_data
+        'historical_data': historical_data,
+        'cursor': latest_id,
+        'since': since
     })
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/sensor-history')
+def get_sensor_history():
+    """Get columnar sensor history for charts and analytics
+
+    Reads from the memory-mapped columnar cache. Query parameters: ``hours``
+    (window ending now, default 168) or explicit ``start`` / ``end`` epoch
+    seconds.
+    """
+    try:
+        sensor_cache.sync()
+        
+        end = request.args.get('end', type=int)
+        start = request.args.get('start', type=int)
+        if start is None:
+            hours = request.args.get('hours', 168, type=float)
+            start = int((end or time.time()) - hours * 3600)
+        
+        columns = sensor_cache.query(start, end)
+        
+        summary = {}
+        for metric in METRIC_COLUMNS:
+            values = columns[metric]
+            summary[metric] = {
+                'min': round(float(values.min()), 2),
+                'max': round(float(values.max()), 2),
+                'mean': round(float(values.mean()), 2)
+            } if len(values) else None
+        
+        return jsonify({
+            'status': 'success',
+            'count': len(columns['timestamp']),
+            'timestamps': columns['timestamp'].tolist(),
+            'temperature': columns['temperature'].astype(np.float64).round(2).tolist(),
+            'humidity': columns['humidity'].astype(np.float64).round(2).tolist(),
+            'soil_moisture': columns['soil_moisture'].astype(np.float64).round(2).tolist(),
+            'summary': summary
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/weather')
+def get_weather():
+    """Get weather for all farm locations, refreshing stale ones concurrently"""
+    try:
+        now = time.time()
+        with _weather_cache_lock:
+            stale = [
+                location for location in FARM_LOCATIONS
+                if is_weather_stale(_weather_cache.get(location), now)
+            ]
+        refresh_weather(stale)
+        
+        with _weather_cache_lock:
+            weather = {
+                location: {'city': city, **_weather_cache[location]['data']}
+                for location, city in FARM_LOCATIONS.items()
+            }
+        return jsonify({'status': 'success', 'weather': weather})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/disease-detection', methods=['POST'])
 def detect_plant_disease():
@@ -186,8 +406,11 @@ def detect_plant_disease():
         if not image_data:
             return jsonify({'error': 'No image data provided'}), 400
         
-        # Detect disease
-        detection_result = disease_detector.detect_disease_simple(image_data)
+        # Detect disease - "tiled" analyses the full-resolution image
+        if data.get('mode') == 'tiled':
+            detection_result = disease_detector.detect_disease_tiled(image_data)
+        else:
+            detection_result = disease_detector.detect_disease_simple(image_data)
         
         if detection_result:
             # Save to history
@@ -217,6 +440,168 @@ def get_disease_history():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def normalize_export_timestamp(value):
+    """Normalize an ISO timestamp query value to the stored 'YYYY-MM-DD HH:MM:SS' form"""
+    if not value:
+        return None
+    return value.replace('T', ' ')
+
+def parse_export_cursor(value):
+    """Parse an 'after' cursor of the form '<timestamp>,<id>'"""
+    if not value:
+        return None
+    timestamp, _, row_id = value.rpartition(',')
+    if not timestamp:
+        raise ValueError("Cursor must be '<timestamp>,<id>'")
+    return normalize_export_timestamp(timestamp), int(row_id)
+
+def iter_sensor_rows(start=None, end=None, after=None):
+    """Yield sensor_data rows in (timestamp, id) order one keyset page at a time"""
+    conn = sqlite3.connect('farm_data.db')
+    try:
+        while True:
+            conditions = []
+            params = []
+            if start:
+                conditions.append('timestamp >= ?')
+                params.append(start)
+            if end:
+                conditions.append('timestamp < ?')
+                params.append(end)
+            if after:
+                # Row-value comparison lets SQLite seek into the (timestamp, id) index
+                conditions.append('(timestamp, id) > (?, ?)')
+                params.extend([after[0], after[1]])
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            cursor = conn.execute(f'''
+                SELECT id, timestamp, temperature, humidity, soil_moisture
+                FROM sensor_data
+                {where}
+                ORDER BY timestamp ASC, id ASC
+                LIMIT ?
+            ''', params + [EXPORT_PAGE_SIZE])
+            
+            row = None
+            for row in cursor:
+                yield {
+                    'id': row[0],
+                    'timestamp': row[1],
+                    'temperature': row[2],
+                    'humidity': row[3],
+                    'soil_moisture': row[4]
+                }
+            if row is None:
+                break
+            after = (row[1], row[0])
+    finally:
+        conn.close()
+
+def iter_disease_rows(start=None, end=None, after=None):
+    """Yield disease detections in (timestamp, id) order
+
+    ``id`` is the stable id stored with each saved detection; records saved
+    before ids were introduced are exported with id 0 and are resumed on
+    their timestamp alone.
+    """
+    history = disease_detector.get_disease_history()
+    records = sorted(
+        (
+            (normalize_export_timestamp(record['timestamp']), record.get('id', 0), record)
+            for record in history
+        ),
+        key=lambda item: item[:2]
+    )
+    for timestamp, row_id, record in records:
+        if start and timestamp < start:
+            continue
+        if end and timestamp >= end:
+            continue
+        if after and (timestamp, row_id) <= after:
+            continue
+        yield {
+            'id': row_id,
+            'timestamp': timestamp,
+            'disease': record.get('disease'),
+            'confidence': record.get('confidence'),
+            'severity': record.get('severity'),
+            'treatment': record.get('treatment')
+        }
+
+EXPORT_SOURCES = {
+    'sensor_data': (
+        iter_sensor_rows,
+        ['id', 'timestamp', 'temperature', 'humidity', 'soil_moisture']
+    ),
+    'disease_detections': (
+        iter_disease_rows,
+        ['id', 'timestamp', 'disease', 'confidence', 'severity', 'treatment']
+    )
+}
+
+def stream_csv(rows, fields):
+    """Encode row dicts as CSV lines, starting with a header row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stream_ndjson(rows):
+    """Encode row dicts as newline-delimited JSON"""
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+@app.route('/api/export')
+def export_history():
+    """Stream sensor or disease history as CSV or NDJSON
+
+    Query parameters: ``table`` (sensor_data | disease_detections),
+    ``format`` (csv | ndjson), optional ``start`` / ``end`` timestamps and
+    ``after`` - the '<timestamp>,<id>' of the last row already received,
+    used to resume an interrupted export.
+
+    sensor_data timestamps are UTC (SQLite CURRENT_TIMESTAMP), while disease
+    detection timestamps are the server's local time (datetime.now()), so
+    ``start`` / ``end`` are interpreted in that table's own clock.
+    """
+    table = request.args.get('table', 'sensor_data')
+    export_format = request.args.get('format', 'csv')
+    
+    if table not in EXPORT_SOURCES:
+        return jsonify({'error': f'Unknown table: {table}'}), 400
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+    
+    try:
+        after = parse_export_cursor(request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid cursor: {e}'}), 400
+    
+    row_source, fields = EXPORT_SOURCES[table]
+    rows = row_source(
+        start=normalize_export_timestamp(request.args.get('start')),
+        end=normalize_export_timestamp(request.args.get('end')),
+        after=after
+    )
+    
+    if export_format == 'csv':
+        body = stream_csv(rows, fields)
+        mimetype = 'text/csv'
+    else:
+        body = stream_ndjson(rows)
+        mimetype = 'application/x-ndjson'
+    
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{export_format}'
+    return response
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -226,6 +611,28 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.after_request
+def compress_response(response):
+    """Compress response bodies with br or gzip when the client accepts it"""
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 if __name__ == '__main__':
     print("🌱 Starting Smart Soil Monitor Server...")
     init_db()
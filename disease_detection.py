@@ -10,9 +10,20 @@ from PIL import Image
 import io
 import base64
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 
+# Edge length in pixels of the square tiles used by tiled analysis
+TILE_SIZE = 128
+
+# Max differing bits (of 192) for two frames to count as the same scene
+FRAME_HASH_THRESHOLD = 6
+
+# Min gray-level step between neighbouring thumbnail cells to set a hash bit,
+# so sensor noise in flat scenes does not flip bits at random
+FRAME_HASH_EPSILON = 2.0
+
 class PlantDiseaseDetector:
     def __init__(self):
         """Initialize the disease detection system"""
@@ -47,20 +58,42 @@ class PlantDiseaseDetector:
             "Medium": "🟡 Moderate issue - Requires treatment within a week",
             "High": "🔴 Severe issue - Immediate treatment required"
         }
+        
+        # HSV color ranges for disease symptoms
+        self.symptom_color_ranges = {
+            # Yellow/brown spots (common in many diseases)
+            "yellow_spots": (np.array([20, 100, 100]), np.array([30, 255, 255])),
+            # Brown/black spots
+            "brown_spots": (np.array([0, 50, 20]), np.array([20, 255, 200])),
+            # White/powdery areas (powdery mildew)
+            "white_powder": (np.array([0, 0, 200]), np.array([180, 30, 255])),
+            # Red/orange areas (rust)
+            "red_rust": (np.array([0, 50, 50]), np.array([10, 255, 255]))
+        }
+
+    def load_image(self, image_data):
+        """Decode base64, raw image bytes or an RGB array into an RGB PIL image"""
+        # Camera frames arrive as RGB numpy arrays
+        if isinstance(image_data, np.ndarray):
+            return Image.fromarray(image_data)
+        
+        # Convert base64 to image
+        if isinstance(image_data, str):
+            image_data = base64.b64decode(image_data.split(',')[1])
+        
+        # Convert to PIL Image
+        image = Image.open(io.BytesIO(image_data))
+        
+        # Convert to RGB if needed
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        return image
 
     def preprocess_image(self, image_data):
         """Preprocess image for disease detection"""
         try:
-            # Convert base64 to image
-            if isinstance(image_data, str):
-                image_data = base64.b64decode(image_data.split(',')[1])
-            
-            # Convert to PIL Image
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            image = self.load_image(image_data)
             
             # Resize to standard size
             image = image.resize((224, 224))
@@ -105,39 +138,32 @@ class PlantDiseaseDetector:
             print(f"Error in disease detection: {e}")
             return None
 
+    def count_symptom_pixels(self, hsv):
+        """Count pixels matching each symptom color range in an HSV image"""
+        counts = {}
+        lesion_mask = None
+        for symptom, (lower, upper) in self.symptom_color_ranges.items():
+            mask = cv2.inRange(hsv, lower, upper)
+            counts[symptom] = cv2.countNonZero(mask)
+            lesion_mask = mask if lesion_mask is None else cv2.bitwise_or(lesion_mask, mask)
+        
+        # Pixels showing any symptom, used for the lesion heat-map
+        counts["lesion"] = cv2.countNonZero(lesion_mask)
+        return counts
+
     def analyze_color_patterns(self, hsv, img):
         """Analyze color patterns to detect diseases"""
-        # Define color ranges for different disease symptoms
-        # Yellow/brown spots (common in many diseases)
-        yellow_lower = np.array([20, 100, 100])
-        yellow_upper = np.array([30, 255, 255])
-        yellow_mask = cv2.inRange(hsv, yellow_lower, yellow_upper)
-        yellow_pixels = cv2.countNonZero(yellow_mask)
-        
-        # Brown/black spots
-        brown_lower = np.array([0, 50, 20])
-        brown_upper = np.array([20, 255, 200])
-        brown_mask = cv2.inRange(hsv, brown_lower, brown_upper)
-        brown_pixels = cv2.countNonZero(brown_mask)
-        
-        # White/powdery areas (powdery mildew)
-        white_lower = np.array([0, 0, 200])
-        white_upper = np.array([180, 30, 255])
-        white_mask = cv2.inRange(hsv, white_lower, white_upper)
-        white_pixels = cv2.countNonZero(white_mask)
-        
-        # Red/orange areas (rust)
-        red_lower = np.array([0, 50, 50])
-        red_upper = np.array([10, 255, 255])
-        red_mask = cv2.inRange(hsv, red_lower, red_upper)
-        red_pixels = cv2.countNonZero(red_mask)
-        
-        # Calculate percentages
+        counts = self.count_symptom_pixels(hsv)
         total_pixels = img.shape[0] * img.shape[1]
-        yellow_percent = (yellow_pixels / total_pixels) * 100
-        brown_percent = (brown_pixels / total_pixels) * 100
-        white_percent = (white_pixels / total_pixels) * 100
-        red_percent = (red_pixels / total_pixels) * 100
+        return self.classify_symptoms(counts, total_pixels)
+
+    def classify_symptoms(self, counts, total_pixels):
+        """Classify disease from symptom pixel counts"""
+        # Calculate percentages
+        yellow_percent = (counts["yellow_spots"] / total_pixels) * 100
+        brown_percent = (counts["brown_spots"] / total_pixels) * 100
+        white_percent = (counts["white_powder"] / total_pixels) * 100
+        red_percent = (counts["red_rust"] / total_pixels) * 100
         
         # Determine disease based on patterns
         disease = "Healthy"
@@ -190,6 +216,180 @@ class PlantDiseaseDetector:
             "severity_description": self.severity_levels.get(severity, "Unknown severity")
         }
 
+    def analyze_tile(self, hsv_tile):
+        """Count symptom pixels in one tile and classify the tile on its own"""
+        counts = self.count_symptom_pixels(hsv_tile)
+        tile_pixels = hsv_tile.shape[0] * hsv_tile.shape[1]
+        return counts, self.classify_symptoms(counts, tile_pixels)
+
+    def detect_disease_tiled(self, image_data, tile_size=TILE_SIZE, max_workers=None):
+        """Full-resolution disease detection on tiles classified in parallel
+        
+        Each tile is classified with the same rules as detect_disease_simple,
+        so a small early-stage spot is judged against its own tile instead of
+        being diluted across the whole leaf. OpenCV releases the GIL, so tiles
+        are processed concurrently on a thread pool. The image-level disease,
+        confidence and severity come from the worst tile; symptoms are the
+        whole-image percentages. Adds a coarse lesion heat-map (percentage of
+        symptomatic pixels per tile) and the number of affected tiles.
+        """
+        try:
+            image = self.load_image(image_data)
+            
+            # Convert to HSV at full resolution
+            hsv = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2HSV)
+            height, width = hsv.shape[:2]
+            
+            # Tile views share memory with the full image
+            tiles = [
+                hsv[y:y + tile_size, x:x + tile_size]
+                for y in range(0, height, tile_size)
+                for x in range(0, width, tile_size)
+            ]
+            rows = -(-height // tile_size)
+            cols = -(-width // tile_size)
+            
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                tile_results = list(executor.map(self.analyze_tile, tiles))
+            
+            # Aggregate per-tile counts into whole-image totals
+            totals = {symptom: 0 for symptom in tile_results[0][0]}
+            for counts, _ in tile_results:
+                for symptom, count in counts.items():
+                    totals[symptom] += count
+            
+            results = self.classify_symptoms(totals, height * width)
+            
+            # Thin edge slivers can reach a threshold on a handful of pixels,
+            # so only tiles of at least a quarter of the full area may vote
+            min_tile_pixels = (tile_size * tile_size) // 4
+            severity_rank = {"Low": 0, "Medium": 1, "High": 2}
+            worst = None
+            affected_tiles = 0
+            for tile, (_, tile_result) in zip(tiles, tile_results):
+                if tile_result["disease"] == "Healthy":
+                    continue
+                if tile.shape[0] * tile.shape[1] < min_tile_pixels:
+                    continue
+                affected_tiles += 1
+                rank = (severity_rank[tile_result["severity"]], tile_result["confidence"])
+                if worst is None or rank > worst[0]:
+                    worst = (rank, tile_result)
+            
+            if worst is not None:
+                tile_result = worst[1]
+                results["disease"] = tile_result["disease"]
+                results["confidence"] = tile_result["confidence"]
+                results["severity"] = tile_result["severity"]
+                results["treatment"] = tile_result["treatment"]
+                results["severity_description"] = tile_result["severity_description"]
+            
+            heatmap = []
+            for row in range(rows):
+                heatmap_row = []
+                for col in range(cols):
+                    tile = tiles[row * cols + col]
+                    lesion = tile_results[row * cols + col][0]["lesion"]
+                    heatmap_row.append(round(lesion / (tile.shape[0] * tile.shape[1]) * 100, 1))
+                heatmap.append(heatmap_row)
+            
+            results["lesion_heatmap"] = heatmap
+            results["affected_tiles"] = affected_tiles
+            results["tiles"] = {
+                "rows": rows,
+                "cols": cols,
+                "tile_size": tile_size,
+                "image_size": [width, height]
+            }
+            
+            return results
+            
+        except Exception as e:
+            print(f"Error in tiled disease detection: {e}")
+            return None
+
+    def frame_hash(self, frame):
+        """Cheap perceptual (difference) hash of a frame as a 192-bit integer
+        
+        64 bits per RGB channel, so colour changes such as brown lesions on
+        a green leaf register even when their brightness barely differs.
+        """
+        # Float thumbnail keeps the area average unrounded
+        small = cv2.resize(frame.astype(np.float32), (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] - small[:, :-1] > FRAME_HASH_EPSILON).transpose(2, 0, 1).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    def iter_frames(self, source, sample_every=1):
+        """Yield (frame_index, RGB frame) from a video source
+        
+        ``source`` is a file path or stream URL (MJPEG/RTSP, read with
+        OpenCV) or any iterable of RGB arrays / encoded image bytes.
+        Only every ``sample_every``-th frame is decoded and yielded.
+        """
+        if sample_every < 1:
+            raise ValueError(f"sample_every must be at least 1, got {sample_every}")
+        
+        if isinstance(source, str):
+            capture = cv2.VideoCapture(source)
+            if not capture.isOpened():
+                raise IOError(f"Cannot open video source: {source}")
+            try:
+                frame_index = 0
+                while True:
+                    # grab() skips frames without decoding them
+                    if frame_index % sample_every:
+                        if not capture.grab():
+                            break
+                    else:
+                        ok, frame = capture.read()
+                        if not ok:
+                            break
+                        yield frame_index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    frame_index += 1
+            finally:
+                capture.release()
+        else:
+            for frame_index, frame in enumerate(source):
+                if frame_index % sample_every:
+                    continue
+                if not isinstance(frame, np.ndarray):
+                    frame = np.asarray(self.load_image(frame))
+                yield frame_index, frame
+
+    def monitor_stream(self, source, sample_every=1, hash_threshold=FRAME_HASH_THRESHOLD,
+                       save_detections=False):
+        """Continuously analyse a camera stream, skipping near-duplicate frames
+        
+        Each sampled frame is hashed and compared with the last analysed
+        frame; detect_disease_simple only runs when the scene has changed,
+        so CPU use follows scene changes rather than frame rate. Yields one
+        record per analysed frame.
+        """
+        last_hash = None
+        skipped_frames = 0
+        
+        for frame_index, frame in self.iter_frames(source, sample_every):
+            current_hash = self.frame_hash(frame)
+            if last_hash is not None and bin(current_hash ^ last_hash).count('1') <= hash_threshold:
+                skipped_frames += 1
+                continue
+            
+            detection = self.detect_disease_simple(frame)
+            if detection is None:
+                continue
+            
+            last_hash = current_hash
+            if save_detections:
+                self.save_disease_detection(detection)
+            
+            yield {
+                "frame_index": frame_index,
+                "timestamp": datetime.now().isoformat(),
+                "skipped_frames": skipped_frames,
+                "detection": detection
+            }
+            skipped_frames = 0
+
     def detect_disease_advanced(self, image_data):
         """Advanced disease detection using pre-trained model (placeholder)"""
         # This would use a real trained model in production
@@ -212,7 +412,11 @@ class PlantDiseaseDetector:
         try:
             history = self.get_disease_history()
             
+            # Stable id that survives trimming the history below
+            last_id = max((record.get("id", 0) for record in history), default=0)
+            
             detection_record = {
+                "id": last_id + 1,
                 "timestamp": datetime.now().isoformat(),
                 "disease": detection_result["disease"],
                 "confidence": detection_result["confidence"],
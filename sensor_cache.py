@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Columnar Sensor History Cache
+Append-only NumPy memmap mirror of the sensor_data table for fast range queries
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+# Rows per memmap segment file
+SEGMENT_ROWS = 65536
+
+# Column name -> dtype stored in each segment
+CACHE_COLUMNS = {
+    "timestamp": np.int64,        # Epoch seconds (UTC)
+    "temperature": np.float32,
+    "humidity": np.float32,
+    "soil_moisture": np.float32
+}
+
+METRIC_COLUMNS = ["temperature", "humidity", "soil_moisture"]
+
+class SensorHistoryCache:
+    def __init__(self, cache_dir='sensor_cache', db_path='farm_data.db'):
+        """Initialize the columnar cache"""
+        self.cache_dir = cache_dir
+        self.db_path = db_path
+        # sensor_data has no device column yet, so all readings belong to one device
+        self.device = "default"
+        self._lock = threading.Lock()
+        self._meta = None
+        self._meta_mtime = None
+
+    def _device_dir(self):
+        return os.path.join(self.cache_dir, self.device)
+
+    def _meta_path(self):
+        return os.path.join(self._device_dir(), 'meta.json')
+
+    def _segment_path(self, segment, column):
+        return os.path.join(self._device_dir(), f'seg_{segment:05d}.{column}.bin')
+
+    def _load_meta(self):
+        """Load segment metadata, re-reading it if another process rebuilt the cache"""
+        try:
+            mtime = os.path.getmtime(self._meta_path())
+        except OSError:
+            mtime = None
+        if self._meta is None or mtime != self._meta_mtime:
+            if mtime is not None:
+                with open(self._meta_path(), 'r') as f:
+                    self._meta = json.load(f)
+            else:
+                self._meta = {"last_id": 0, "segments": []}
+            self._meta_mtime = mtime
+        return self._meta
+
+    def _save_meta(self):
+        os.makedirs(self._device_dir(), exist_ok=True)
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path())
+        self._meta_mtime = os.path.getmtime(self._meta_path())
+
+    def _open_segment(self, segment, column, mode='r'):
+        return np.memmap(self._segment_path(segment, column), dtype=CACHE_COLUMNS[column],
+                         mode=mode, shape=(SEGMENT_ROWS,))
+
+    def _append(self, timestamps, metrics):
+        """Append rows (already sorted by timestamp) to the segment files"""
+        meta = self._meta
+        offset = 0
+        while offset < len(timestamps):
+            if not meta["segments"] or meta["segments"][-1]["rows"] >= SEGMENT_ROWS:
+                os.makedirs(self._device_dir(), exist_ok=True)
+                segment = len(meta["segments"])
+                for column in CACHE_COLUMNS:
+                    self._open_segment(segment, column, mode='w+').flush()
+                meta["segments"].append({"rows": 0, "first": None, "last": None})
+
+            segment = len(meta["segments"]) - 1
+            info = meta["segments"][segment]
+            count = min(SEGMENT_ROWS - info["rows"], len(timestamps) - offset)
+
+            values = {"timestamp": timestamps}
+            values.update(metrics)
+            for column, data in values.items():
+                mapped = self._open_segment(segment, column, mode='r+')
+                mapped[info["rows"]:info["rows"] + count] = data[offset:offset + count]
+                mapped.flush()
+                del mapped
+
+            if info["first"] is None:
+                info["first"] = int(timestamps[offset])
+            info["last"] = int(timestamps[offset + count - 1])
+            info["rows"] += count
+            offset += count
+
+    def _fetch_rows(self, conn, after_id):
+        """Read sensor_data rows newer than after_id, ordered by time"""
+        cursor = conn.execute('''
+            SELECT id, CAST(strftime('%s', timestamp) AS INTEGER),
+                   temperature, humidity, soil_moisture
+            FROM sensor_data
+            WHERE id > ?
+            ORDER BY timestamp ASC, id ASC
+        ''', (after_id,))
+        while True:
+            rows = cursor.fetchmany(SEGMENT_ROWS)
+            if not rows:
+                break
+            yield rows
+
+    def _append_batch(self, rows):
+        """Append a batch of fetched rows and advance last_id"""
+        batch = np.array([row[1:] for row in rows], dtype=np.float64)
+        timestamps = batch[:, 0].astype(np.int64)
+        metrics = {
+            column: batch[:, index + 1].astype(np.float32)
+            for index, column in enumerate(METRIC_COLUMNS)
+        }
+        self._append(timestamps, metrics)
+        self._meta["last_id"] = max(self._meta["last_id"], max(row[0] for row in rows))
+
+    def _rebuild_locked(self):
+        """Rebuild the cache from SQLite; the caller must hold self._lock"""
+        shutil.rmtree(self._device_dir(), ignore_errors=True)
+        self._meta = {"last_id": 0, "segments": []}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for rows in self._fetch_rows(conn, 0):
+                self._append_batch(rows)
+        finally:
+            conn.close()
+        self._save_meta()
+        return self.row_count()
+
+    def rebuild(self):
+        """Rebuild the cache from scratch out of the SQLite database"""
+        with self._lock:
+            return self._rebuild_locked()
+
+    def sync(self):
+        """Append readings stored in SQLite since the last sync
+
+        Readings are appended in time order. If a new reading is older than
+        the newest cached one (e.g. backfilled demo data) the cache is rebuilt
+        so timestamps stay sorted for searchsorted.
+        """
+        with self._lock:
+            meta = self._load_meta()
+            needs_rebuild = self._meta_mtime is None
+            added = 0
+            if not needs_rebuild:
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    for rows in self._fetch_rows(conn, meta["last_id"]):
+                        if meta["segments"] and rows[0][1] < meta["segments"][-1]["last"]:
+                            needs_rebuild = True
+                            break
+                        self._append_batch(rows)
+                        added += len(rows)
+                finally:
+                    conn.close()
+                if added and not needs_rebuild:
+                    self._save_meta()
+
+            # Rebuild while still holding the lock so concurrent syncs
+            # cannot rewrite the same segment files at once
+            if needs_rebuild:
+                return self._rebuild_locked()
+            return added
+
+    def row_count(self):
+        """Total number of cached readings"""
+        return sum(info["rows"] for info in self._load_meta()["segments"])
+
+    def query(self, start=None, end=None):
+        """Return cached columns for readings with start <= timestamp < end
+
+        ``start`` and ``end`` are epoch seconds. Results within a single
+        segment are zero-copy memmap slices; ranges spanning segments are
+        concatenated. Slices stay readable after a later rebuild because
+        rebuild unlinks the old segment files instead of overwriting them.
+        """
+        with self._lock:
+            segments = list(enumerate(self._load_meta()["segments"]))
+
+            # Open the memmaps under the lock so a concurrent rebuild cannot
+            # remove or zero the segment files in between
+            parts = {column: [] for column in CACHE_COLUMNS}
+            for segment, info in segments:
+                if not info["rows"]:
+                    continue
+                if start is not None and info["last"] < start:
+                    continue
+                if end is not None and info["first"] >= end:
+                    continue
+
+                timestamps = self._open_segment(segment, "timestamp")[:info["rows"]]
+                lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+                hi = info["rows"] if end is None else int(np.searchsorted(timestamps, end, side='left'))
+                if lo >= hi:
+                    continue
+
+                parts["timestamp"].append(timestamps[lo:hi])
+                for column in METRIC_COLUMNS:
+                    parts[column].append(self._open_segment(segment, column)[lo:hi])
+
+        result = {}
+        for column, arrays in parts.items():
+            if not arrays:
+                result[column] = np.empty(0, dtype=CACHE_COLUMNS[column])
+            elif len(arrays) == 1:
+                result[column] = arrays[0]
+            else:
+                result[column] = np.concatenate(arrays)
+        return result
+
+# Global cache instance
+sensor_cache = SensorHistoryCache()
+
+def main():
+    """Rebuild the columnar cache from farm_data.db"""
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("Usage: python sensor_cache.py rebuild")
+        return
+
+    print("📦 Rebuilding columnar sensor cache from SQLite...")
+    rows = sensor_cache.rebuild()
+    print(f"✅ Cached {rows} readings in {sensor_cache.cache_dir}/")
+
+if __name__ == "__main__":
+    main()
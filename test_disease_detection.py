@@ -71,6 +71,73 @@ def test_disease_detection():
     except Exception as e:
         print(f"❌ Error testing disease detection: {e}")
 
+def test_tiled_disease_detection():
+    """Test full-resolution tiled disease detection"""
+    print("\n🧩 Testing Tiled Disease Detection...")
+    
+    test_image = create_test_image()
+    
+    try:
+        response = requests.post(
+            'http://localhost:5000/api/disease-detection',
+            json={'image': test_image, 'mode': 'tiled'},
+            headers={'Content-Type': 'application/json'},
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            print("✅ Tiled disease detection successful!")
+            print(f"   Disease: {result['detection']['disease']}")
+            print(f"   Symptoms: {result['detection']['symptoms']}")
+            print(f"   Tiles: {result['detection']['tiles']}")
+            print(f"   Lesion heat-map: {result['detection']['lesion_heatmap']}")
+        else:
+            print(f"❌ Error: {response.status_code}")
+            print(f"   Response: {response.text}")
+            
+    except Exception as e:
+        print(f"❌ Error testing tiled disease detection: {e}")
+
+def test_stream_monitoring():
+    """Test camera-stream monitoring with near-duplicate frame skipping"""
+    print("\n🎥 Testing Stream Monitoring...")
+    
+    from disease_detection import disease_detector
+    
+    def simulated_camera():
+        """Yield 20 frames of a healthy leaf, then 20 with a diseased spot"""
+        healthy = np.array(Image.new('RGB', (320, 240), color='green'))
+        diseased = healthy.copy()
+        diseased[80:160, 100:200] = [139, 69, 19]  # Brown
+        for i in range(40):
+            yield healthy if i < 20 else diseased
+    
+    try:
+        analysed = list(disease_detector.monitor_stream(simulated_camera()))
+        print(f"✅ Analysed {len(analysed)} of 40 frames")
+        for record in analysed:
+            print(f"     - Frame {record['frame_index']}: {record['detection']['disease']} "
+                  f"(skipped {record['skipped_frames']} similar frames)")
+    except Exception as e:
+        print(f"❌ Error testing stream monitoring: {e}")
+    
+    def noisy_static_camera():
+        """Yield 30 frames of a flat green scene with ±3 sensor noise"""
+        flat = np.array(Image.new('RGB', (320, 240), color=(40, 140, 40)), dtype=np.int16)
+        for i in range(30):
+            noise = np.random.randint(-3, 4, flat.shape)
+            yield np.clip(flat + noise, 0, 255).astype(np.uint8)
+    
+    try:
+        analysed = list(disease_detector.monitor_stream(noisy_static_camera()))
+        if len(analysed) == 1:
+            print("✅ Noisy static scene analysed once, 29 frames skipped")
+        else:
+            print(f"❌ Noisy static scene analysed {len(analysed)} of 30 frames")
+    except Exception as e:
+        print(f"❌ Error testing noisy stream monitoring: {e}")
+
 def test_disease_history():
     """Test disease history endpoint"""
     print("\n📊 Testing Disease History...")
@@ -100,6 +167,12 @@ def main():
     # Test disease detection
     test_disease_detection()
     
+    # Test tiled full-resolution detection
+    test_tiled_disease_detection()
+    
+    # Test stream monitoring
+    test_stream_monitoring()
+    
     # Test disease history
     test_disease_history()
     
@@ -8,7 +8,9 @@ import requests
 import json
 import time
 import random
+import threading
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 def test_api_endpoints():
     """Test all API endpoints"""
@@ -44,6 +46,152 @@ def test_api_endpoints():
     
     return True
 
+def test_dashboard_conditional_get():
+    """Test ETag, since cursor and compression on the dashboard endpoint"""
+    base_url = "http://localhost:5000"
+    
+    print("\n🔁 Testing dashboard conditional GET...")
+    
+    try:
+        response = requests.get(
+            f"{base_url}/api/dashboard-data",
+            headers={"Accept-Encoding": "gzip"},
+            timeout=5
+        )
+        etag = response.headers.get('ETag')
+        data = response.json()
+        print(f"   ETag: {etag}, cursor: {data.get('cursor')}")
+        
+        encoding = response.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            print("✅ Response was gzip-compressed")
+        elif len(response.content) < 500:
+            print(f"ℹ️ Response too small to compress ({len(response.content)} bytes)")
+        else:
+            print(f"❌ Expected gzip Content-Encoding, got {encoding}")
+        
+        response = requests.get(
+            f"{base_url}/api/dashboard-data",
+            headers={"If-None-Match": etag},
+            timeout=5
+        )
+        if response.status_code == 304:
+            print("✅ Unchanged poll returned 304 Not Modified")
+        else:
+            print(f"❌ Expected 304, got {response.status_code}")
+        
+        response = requests.get(
+            f"{base_url}/api/dashboard-data",
+            params={"since": data.get('cursor')},
+            timeout=5
+        )
+        if response.status_code == 200:
+            print(f"✅ Delta poll returned {len(response.json()['historical_data'])} new rows")
+        else:
+            print(f"❌ Delta poll failed: {response.status_code}")
+    except Exception as e:
+        print(f"❌ Conditional GET error: {e}")
+
+def test_history_export():
+    """Test streaming history export and resuming from a cursor"""
+    base_url = "http://localhost:5000"
+    
+    print("\n📦 Testing history export...")
+    
+    try:
+        response = requests.get(
+            f"{base_url}/api/export",
+            params={"table": "sensor_data", "format": "ndjson"},
+            stream=True,
+            timeout=10
+        )
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        print(f"✅ Exported {len(rows)} sensor rows as NDJSON")
+        
+        if len(rows) > 1:
+            middle = rows[len(rows) // 2]
+            response = requests.get(
+                f"{base_url}/api/export",
+                params={"format": "ndjson", "after": f"{middle['timestamp']},{middle['id']}"},
+                timeout=10
+            )
+            resumed = [line for line in response.text.splitlines() if line]
+            print(f"✅ Resumed export returned {len(resumed)} remaining rows")
+        
+        response = requests.get(
+            f"{base_url}/api/export",
+            params={"table": "disease_detections", "format": "csv"},
+            timeout=10
+        )
+        print(f"✅ Disease detection CSV: {len(response.text.splitlines()) - 1} rows")
+    except Exception as e:
+        print(f"❌ History export error: {e}")
+
+def test_sensor_history():
+    """Test columnar sensor history endpoint"""
+    base_url = "http://localhost:5000"
+    
+    print("\n📈 Testing sensor history...")
+    
+    try:
+        response = requests.get(f"{base_url}/api/sensor-history", params={"hours": 168}, timeout=5)
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ Sensor history returned {data['count']} readings")
+            print(f"   Summary: {data['summary']}")
+        else:
+            print(f"❌ Sensor history failed: {response.status_code}")
+    except Exception as e:
+        print(f"❌ Sensor history error: {e}")
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """Local OpenWeatherMap stand-in with a fixed 200 ms response delay"""
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    
+    def do_GET(self):
+        time.sleep(0.2)
+        body = json.dumps({
+            'main': {'temp': 28.5, 'humidity': 62, 'pressure': 1009},
+            'weather': [{'description': 'scattered clouds'}],
+            'wind': {'speed': 3.1}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class StubWeatherServer(ThreadingHTTPServer):
+    request_queue_size = 64  # Accept all concurrent connections
+
+def test_multi_location_weather():
+    """Test concurrent weather refresh for many farms against a local stub server"""
+    print("\n🌦️ Testing multi-location weather refresh...")
+    
+    import app
+    
+    server = StubWeatherServer(('127.0.0.1', 0), StubWeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app.WEATHER_API_URL = f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather"
+    
+    try:
+        locations = [f"farm-{i}" for i in range(50)]
+        app.FARM_LOCATIONS.update({location: f"District {i}" for i, location in enumerate(locations)})
+        start = time.time()
+        weather = app.refresh_weather(locations)
+        elapsed = time.time() - start
+        
+        fetched = sum(1 for data in weather.values() if data['description'] == 'scattered clouds')
+        print(f"✅ Refreshed {fetched}/{len(locations)} locations in {elapsed:.2f}s "
+              f"({app.WEATHER_MAX_WORKERS} parallel requests)")
+    except Exception as e:
+        print(f"❌ Multi-location weather error: {e}")
+    finally:
+        server.shutdown()
+
 def generate_demo_data():
     """Generate demo sensor data for testing"""
     print("\n📊 Generating demo sensor data...")
@@ -92,6 +240,18 @@ def main():
         print("\n❌ Server not running. Please start with: python app.py")
         return
     
+    # Test conditional GET and delta responses
+    test_dashboard_conditional_get()
+    
+    # Test streaming history export
+    test_history_export()
+    
+    # Test columnar sensor history
+    test_sensor_history()
+    
+    # Test concurrent weather refresh against a stub server
+    test_multi_location_weather()
+    
     # Generate demo data
     generate_demo_data()
     